@@ -16,21 +16,35 @@ class Settings(BaseSettings):
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
+    WORKERS: int = 1
+    PRELOAD_MODELS: bool = True
     
-    # ChromaDB
+    # Vector index
+    FAISS_INDEX_DIRECTORY: str = "./faiss_index"
+    
+    # ChromaDB, only read to import collections from older versions
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
     
     # Models
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     LLM_MODEL: str = "google/flan-t5-base"
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_ONNX_DIR: Optional[str] = None
+    QUERY_CACHE_SIZE: int = 1024
+    LLM_LOAD_IN_8BIT: bool = False
     
     # Document Processing
     CHUNK_SIZE: int = 500
     CHUNK_OVERLAP: int = 50
     MAX_FILE_SIZE_MB: int = 10
+    SINGLE_DOCUMENT_MAX_CHARS: int = 1500
     
     # Directories
     UPLOAD_DIR: str = "./uploads"
+    SUBJECTS_DB_PATH: str = "./subjects.db"
+    EMBEDDING_CACHE_DIRECTORY: str = "./embeddings_cache"
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_MB: int = 1024
     
 
 
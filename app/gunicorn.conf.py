@@ -0,0 +1,21 @@
+import gc
+from config import settings
+
+
+# Import the app, and with it the models, in the master process before
+# forking so that all workers share the same model weights
+preload_app = True
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = settings.WORKERS
+bind = f"{settings.HOST}:{settings.PORT}"
+
+
+def when_ready(server):
+    """Load the LLM and freeze preloaded objects before the workers are forked"""
+    if settings.PRELOAD_MODELS:
+        # Otherwise every worker would load its own copy on the first question
+        from services.chatbot_service import get_chatbot_service
+        get_chatbot_service()
+    
+    # Keep garbage collection in the workers from copying the preloaded pages
+    gc.freeze()
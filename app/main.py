@@ -8,7 +8,7 @@ from routers import subjects, documents, chat
 
 # Create necessary directories
 Path(settings.UPLOAD_DIR).mkdir(exist_ok=True)
-Path(settings.CHROMA_PERSIST_DIRECTORY).mkdir(exist_ok=True)
+Path(settings.FAISS_INDEX_DIRECTORY).mkdir(exist_ok=True)
 
 
 @asynccontextmanager
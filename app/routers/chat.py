@@ -36,7 +36,8 @@ async def ask_question(request: ChatRequest):
         chatbot = get_chatbot_service()
         result = chatbot.answer_question(
             subject_id=request.subject_id,
-            question=request.question
+            question=request.question,
+            subject_documents=subject["documents"]
         )
         
         return ChatResponse(
@@ -1,11 +1,17 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
 import uuid
+import codecs
+import hashlib
+import aiofiles
+import numpy as np
 from pathlib import Path
 from config import settings
 from schemas import DocumentUploadResponse
 from services.subject_service import subject_service
 from services.vector_db_service import vector_db_service
+from services.embedding_cache_service import embedding_cache_service
 from utils.document_processor import (
     extract_text_from_pdf,
     extract_text_from_txt,
@@ -20,6 +26,136 @@ router = APIRouter(prefix="/documents", tags=["Documents"])
 UPLOAD_DIR = Path(settings.UPLOAD_DIR)
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Size of each read when streaming an upload to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _process_upload(
+    file_path: Path,
+    file_ext: str,
+    text: Optional[str],
+    content_hash: str,
+    subject_id: str,
+    document_id: str,
+    filename: str
+) -> int:
+    """
+    Extract, chunk and index a saved upload
+    
+    Args:
+        file_path: Path of the saved upload
+        file_ext: File extension, including the dot
+        text: Already decoded text for TXT files, if available
+        content_hash: Hex digest of the file content
+        subject_id: Subject identifier
+        document_id: Document identifier
+        filename: Original name of the file
+        
+    Returns:
+        Number of chunks created
+    """
+    # A file that was processed before reuses its chunks and embeddings
+    cached = embedding_cache_service.load(content_hash)
+    if cached is not None:
+        return _index_chunks(
+            chunks=cached["chunks"],
+            embeddings=cached["embeddings"],
+            total_chars=cached["total_chars"],
+            file_ext=file_ext,
+            subject_id=subject_id,
+            document_id=document_id,
+            filename=filename
+        )
+    
+    # Extract text based on file type
+    if file_ext == '.pdf':
+        text = extract_text_from_pdf(file_path)
+    elif text is None:  # .txt that is not valid UTF-8
+        text = extract_text_from_txt(file_path.read_bytes())
+    
+    if not text or not text.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="No text could be extracted from the file"
+        )
+    
+    # Chunk the text
+    chunks = chunk_text(
+        text,
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP
+    )
+    
+    if not chunks:
+        raise HTTPException(
+            status_code=400,
+            detail="No valid chunks created from the document"
+        )
+    
+    embeddings = vector_db_service.encode_chunks(chunks)
+    embedding_cache_service.save(content_hash, chunks, len(text), embeddings)
+    
+    return _index_chunks(
+        chunks=chunks,
+        embeddings=embeddings,
+        total_chars=len(text),
+        file_ext=file_ext,
+        subject_id=subject_id,
+        document_id=document_id,
+        filename=filename
+    )
+
+
+def _index_chunks(
+    chunks: List[str],
+    embeddings: np.ndarray,
+    total_chars: int,
+    file_ext: str,
+    subject_id: str,
+    document_id: str,
+    filename: str
+) -> int:
+    """
+    Store embedded chunks and register the document with its subject
+    
+    Args:
+        chunks: Text chunks of the document
+        embeddings: Embedding of each chunk
+        total_chars: Length of the extracted text
+        file_ext: File extension, including the dot
+        subject_id: Subject identifier
+        document_id: Document identifier
+        filename: Original name of the file
+        
+    Returns:
+        Number of chunks created
+    """
+    # Store in vector database
+    metadata = {
+        "filename": filename,
+        "file_type": file_ext[1:],  # Remove the dot
+        "subject_id": subject_id
+    }
+    
+    chunks_created = vector_db_service.add_documents(
+        subject_id=subject_id,
+        document_id=document_id,
+        chunks=chunks,
+        metadata=metadata,
+        embeddings=embeddings
+    )
+    
+    # Add document to subject
+    subject_service.add_document_to_subject(
+        subject_id=subject_id,
+        document_id=document_id,
+        filename=filename,
+        file_type=file_ext[1:],
+        total_chars=total_chars
+    )
+    
+    return chunks_created
+
 
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
@@ -49,69 +185,54 @@ async def upload_document(
             detail="Only PDF and TXT files are supported"
         )
     
-    # Check file size
-    content = await file.read()
-    file_size_mb = len(content) / (1024 * 1024)
-    if file_size_mb > settings.MAX_FILE_SIZE_MB:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File size exceeds maximum of {settings.MAX_FILE_SIZE_MB}MB"
-        )
+    # Generate document ID
+    document_id = str(uuid.uuid4())
+    file_path = UPLOAD_DIR / f"{document_id}_{file.filename}"
+    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
     
     try:
-        # Extract text based on file type
-        if file_ext == '.pdf':
-            text = extract_text_from_pdf(content)
-        else:  # .txt
-            text = extract_text_from_txt(content)
-        
-        if not text or not text.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="No text could be extracted from the file"
-            )
-        
-        # Chunk the text
-        chunks = chunk_text(
-            text,
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP
-        )
-        
-        if not chunks:
-            raise HTTPException(
-                status_code=400,
-                detail="No valid chunks created from the document"
-            )
-        
-        # Generate document ID
-        document_id = str(uuid.uuid4())
+        # Stream the upload to disk, checking the size as it arrives.
+        # TXT files are decoded as UTF-8 incrementally along the way.
+        size = 0
+        hasher = hashlib.blake2b(digest_size=32)
+        decoder = codecs.getincrementaldecoder('utf-8')() if file_ext == '.txt' else None
+        text_parts = []
+        async with aiofiles.open(file_path, 'wb') as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size exceeds maximum of {settings.MAX_FILE_SIZE_MB}MB"
+                    )
+                await f.write(chunk)
+                hasher.update(chunk)
+                
+                if decoder is not None:
+                    try:
+                        text_parts.append(decoder.decode(chunk))
+                    except UnicodeDecodeError:
+                        decoder = None
+                        text_parts = []
         
-        # Save file
-        file_path = UPLOAD_DIR / f"{document_id}_{file.filename}"
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        if decoder is not None:
+            try:
+                text_parts.append(decoder.decode(b"", final=True))
+            except UnicodeDecodeError:
+                decoder = None
+                text_parts = []
         
-        # Store in vector database
-        metadata = {
-            "filename": file.filename,
-            "file_type": file_ext[1:],  # Remove the dot
-            "subject_id": subject_id
-        }
-        
-        chunks_created = vector_db_service.add_documents(
-            subject_id=subject_id,
-            document_id=document_id,
-            chunks=chunks,
-            metadata=metadata
-        )
-        
-        # Add document to subject
-        subject_service.add_document_to_subject(
+        # Extraction, chunking and embedding are CPU-bound, so run them
+        # in the threadpool to keep the event loop free for other requests
+        chunks_created = await run_in_threadpool(
+            _process_upload,
+            file_path=file_path,
+            file_ext=file_ext,
+            text="".join(text_parts) if decoder is not None else None,
+            content_hash=hasher.hexdigest(),
             subject_id=subject_id,
             document_id=document_id,
-            filename=file.filename,
-            file_type=file_ext[1:]
+            filename=file.filename
         )
         
         return DocumentUploadResponse(
@@ -123,9 +244,14 @@ async def upload_document(
             message="Document uploaded and processed successfully"
         )
         
+    except HTTPException:
+        file_path.unlink(missing_ok=True)
+        raise
     except ValueError as e:
+        file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        file_path.unlink(missing_ok=True)
         raise HTTPException(
             status_code=500,
             detail=f"Error processing document: {str(e)}"
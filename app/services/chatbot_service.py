@@ -1,10 +1,22 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, BitsAndBytesConfig
 import torch
-from typing import List, Dict
+from typing import List, Dict, Optional
 from services.vector_db_service import vector_db_service
+from services.subject_service import subject_service
 from config import settings
 
 
+# Fixed instruction that starts every prompt
+PROMPT_PREFIX = (
+    "Based on the following context, answer the question. If the context "
+    "doesn't contain relevant information, say \"No information found in "
+    "the subject documents.\""
+)
+
+# Maximum number of input tokens accepted by the model
+MAX_INPUT_TOKENS = 512
+
+
 class ChatbotService:
     """Service for RAG-based chatbot"""
     
@@ -12,19 +24,53 @@ class ChatbotService:
         """Initialize the LLM model"""
         print(f"Loading LLM model: {settings.LLM_MODEL}")
         self.tokenizer = AutoTokenizer.from_pretrained(settings.LLM_MODEL)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(settings.LLM_MODEL)
-        
-        # Move to GPU if available
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = self.model.to(self.device)
-        print(f"Model loaded on device: {self.device}")
+        
+        if self.device == "cuda" and settings.LLM_LOAD_IN_8BIT:
+            # int8 weights via bitsandbytes, placed on the GPU by accelerate
+            self.model = AutoModelForSeq2SeqLM.from_pretrained(
+                settings.LLM_MODEL,
+                quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+                device_map="auto"
+            )
+        else:
+            # Half precision on GPU, preferring bf16 which T5 was trained in
+            if self.device == "cuda":
+                dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            else:
+                dtype = torch.float32
+            self.model = AutoModelForSeq2SeqLM.from_pretrained(
+                settings.LLM_MODEL,
+                torch_dtype=dtype
+            )
+            self.model = self.model.to(self.device)
+        print(f"Model loaded on device: {self.device} ({self.model.dtype})")
+        
+        # The instruction prefix never changes, so tokenize it only once
+        self._prefix_ids = self.tokenizer(
+            PROMPT_PREFIX,
+            add_special_tokens=False,
+            return_tensors="pt"
+        ).input_ids.to(self.device)
     
-    def _create_context(self, documents: List[str]) -> str:
+    def _create_context(
+        self,
+        documents: List[str],
+        question: str,
+        max_documents: Optional[int] = 5
+    ) -> str:
         """
         Create context from retrieved documents
         
+        Documents are added in ranking order only while the whole prompt
+        still fits the model's input limit, so the question is never
+        truncated away.
+        
         Args:
             documents: List of retrieved document chunks
+            question: User's question
+            max_documents: Maximum number of chunks to use, or None for
+                as many as fit
             
         Returns:
             Formatted context string
@@ -32,11 +78,31 @@ class ChatbotService:
         if not documents:
             return ""
         
-        context = "Context:\n"
-        for i, doc in enumerate(documents[:5], 1):  # Limit to top 5 documents
-            context += f"{i}. {doc}\n\n"
-        
-        return context
+        # Tokens left after the prefix, the question and the fixed wording
+        overhead = len(self.tokenizer(
+            f"Context:\n\n\nQuestion: {question}\nAnswer:"
+        ).input_ids)
+        budget = MAX_INPUT_TOKENS - self._prefix_ids.shape[1] - overhead
+        
+        entries = [
+            f"{i}. {doc}\n\n"
+            for i, doc in enumerate(documents[:max_documents], 1)
+        ]
+        token_ids = self.tokenizer(entries, add_special_tokens=False).input_ids
+        
+        included = []
+        for entry, ids in zip(entries, token_ids):
+            if len(ids) > budget:
+                break
+            included.append(entry)
+            budget -= len(ids)
+        
+        if not included and budget > 0:
+            # Even the best match is too long, so keep as much of it as fits
+            truncated = self.tokenizer.decode(token_ids[0][:budget])
+            included.append(f"{truncated}\n\n")
+        
+        return "Context:\n" + "".join(included)
     
     def _generate_answer(self, question: str, context: str) -> str:
         """
@@ -52,29 +118,26 @@ class ChatbotService:
         if not context:
             return "No information found in the subject documents."
         
-        # Create prompt for the model
-        prompt = f"""Based on the following context, answer the question. If the context doesn't contain relevant information, say "No information found in the subject documents."
-
-{context}
-
-Question: {question}
-Answer:"""
-        
-        # Tokenize and generate
+        # Tokenize only the dynamic part of the prompt and append it to
+        # the pre-tokenized instruction prefix
         inputs = self.tokenizer(
-            prompt,
+            f"\n\n{context}\n\nQuestion: {question}\nAnswer:",
             return_tensors="pt",
-            max_length=512,
+            max_length=MAX_INPUT_TOKENS - self._prefix_ids.shape[1],
             truncation=True
         ).to(self.device)
+        input_ids = torch.cat([self._prefix_ids, inputs.input_ids], dim=1)
+        attention_mask = torch.ones_like(input_ids)
         
         with torch.no_grad():
             outputs = self.model.generate(
-                **inputs,
+                input_ids=input_ids,
+                attention_mask=attention_mask,
                 max_length=150,
-                num_beams=4,
+                num_beams=2,
+                do_sample=False,
                 early_stopping=True,
-                temperature=0.7
+                use_cache=True
             )
         
         answer = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
@@ -89,7 +152,8 @@ Answer:"""
         self,
         subject_id: str,
         question: str,
-        n_results: int = 5
+        n_results: int = 5,
+        subject_documents: Optional[List[Dict]] = None
     ) -> Dict:
         """
         Answer a question based on subject documents
@@ -98,16 +162,32 @@ Answer:"""
             subject_id: Subject identifier
             question: User's question
             n_results: Number of documents to retrieve
+            subject_documents: Document references of the subject, looked
+                up here if omitted
             
         Returns:
             Dictionary with answer and sources
         """
-        # Retrieve relevant documents
-        results = vector_db_service.query_documents(
-            subject_id=subject_id,
-            query=question,
-            n_results=n_results
+        if subject_documents is None:
+            subject = subject_service.get_subject(subject_id)
+            subject_documents = subject["documents"] if subject else []
+        
+        # A single short document fits in the context whole, so skip the
+        # query embedding and vector search and use all of its chunks
+        whole_document = (
+            len(subject_documents) == 1
+            and subject_documents[0].get("total_chars") is not None
+            and subject_documents[0]["total_chars"] <= settings.SINGLE_DOCUMENT_MAX_CHARS
         )
+        if whole_document:
+            results = vector_db_service.get_all_documents(subject_id)
+        else:
+            # Retrieve relevant documents
+            results = vector_db_service.query_documents(
+                subject_id=subject_id,
+                query=question,
+                n_results=n_results
+            )
         
         documents = results.get("documents", [])
         metadatas = results.get("metadatas", [])
@@ -119,8 +199,13 @@ Answer:"""
                 "sources": []
             }
         
-        # Create context from documents
-        context = self._create_context(documents)
+        # Create context from documents, keeping every chunk of a whole
+        # document that fits the token budget
+        context = self._create_context(
+            documents,
+            question,
+            max_documents=None if whole_document else n_results
+        )
         
         # Generate answer
         answer = self._generate_answer(question, context)
@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import uuid
+import numpy as np
+from pathlib import Path
+from config import settings
+
+
+class EmbeddingCacheService:
+    """Service for reusing the chunks and embeddings of previously uploaded files"""
+    
+    def __init__(self):
+        """Initialize the cache directory"""
+        self.enabled = settings.EMBEDDING_CACHE_ENABLED
+        self.max_bytes = settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+        self.cache_dir = Path(settings.EMBEDDING_CACHE_DIRECTORY)
+        if self.enabled:
+            self.cache_dir.mkdir(exist_ok=True)
+        
+        # Cached results are only valid for the same model and chunking
+        self.namespace = "|".join([
+            settings.EMBEDDING_ONNX_DIR or settings.EMBEDDING_MODEL,
+            str(settings.CHUNK_SIZE),
+            str(settings.CHUNK_OVERLAP)
+        ])
+    
+    def _paths(self, content_hash: str):
+        """Get the chunk and embedding file paths for a content hash"""
+        key = hashlib.blake2b(
+            f"{self.namespace}|{content_hash}".encode(),
+            digest_size=32
+        ).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.npy"
+    
+    def load(self, content_hash: str) -> Optional[Dict]:
+        """
+        Load the cached processing result of a file
+        
+        Args:
+            content_hash: Hex digest of the file content
+            
+        Returns:
+            Dictionary with chunks, total_chars and embeddings, or None
+        """
+        if not self.enabled:
+            return None
+        
+        chunks_path, embeddings_path = self._paths(content_hash)
+        try:
+            with open(chunks_path, 'r') as f:
+                cached = json.load(f)
+            embeddings = np.load(embeddings_path)
+            
+            # Mark the entry as recently used so pruning keeps it
+            os.utime(chunks_path)
+        except (OSError, ValueError):
+            return None  # Not cached, or partially written
+        
+        if len(embeddings) != len(cached["chunks"]):
+            return None
+        
+        cached["embeddings"] = embeddings
+        return cached
+    
+    def save(
+        self,
+        content_hash: str,
+        chunks: List[str],
+        total_chars: int,
+        embeddings: np.ndarray
+    ):
+        """
+        Cache the processing result of a file
+        
+        Args:
+            content_hash: Hex digest of the file content
+            chunks: Text chunks of the file
+            total_chars: Length of the extracted text
+            embeddings: Embedding of each chunk
+        """
+        if not self.enabled:
+            return
+        
+        chunks_path, embeddings_path = self._paths(content_hash)
+        
+        # Write to temporary files first so readers never see partial data
+        tmp_name = uuid.uuid4().hex
+        tmp_embeddings_path = self.cache_dir / f"{tmp_name}.tmp.npy"
+        np.save(tmp_embeddings_path, embeddings)
+        os.replace(tmp_embeddings_path, embeddings_path)
+        
+        tmp_chunks_path = self.cache_dir / f"{tmp_name}.tmp.json"
+        with open(tmp_chunks_path, 'w') as f:
+            json.dump({"chunks": chunks, "total_chars": total_chars}, f)
+        os.replace(tmp_chunks_path, chunks_path)
+        
+        self._prune()
+    
+    def _prune(self):
+        """Delete the least recently used entries while the cache is over its size limit"""
+        entries = {}
+        total_size = 0
+        for path in self.cache_dir.iterdir():
+            if ".tmp." in path.name:
+                continue  # Being written by another upload
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Pruned by another worker
+            
+            size, last_used = entries.get(path.stem, (0, 0))
+            if path.suffix == ".json":
+                last_used = stat.st_mtime
+            entries[path.stem] = (size + stat.st_size, last_used)
+            total_size += stat.st_size
+        
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total_size <= self.max_bytes:
+                break
+            (self.cache_dir / f"{key}.json").unlink(missing_ok=True)
+            (self.cache_dir / f"{key}.npy").unlink(missing_ok=True)
+            total_size -= size
+
+
+# Singleton instance
+embedding_cache_service = EmbeddingCacheService()
@@ -2,31 +2,134 @@ from typing import Dict, List, Optional
 import uuid
 from datetime import datetime
 import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from config import settings
 from services.vector_db_service import vector_db_service
 
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    subject_id TEXT NOT NULL REFERENCES subjects(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    uploaded_at TEXT NOT NULL,
+    total_chars INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_documents_subject_id ON documents(subject_id);
+"""
+
+
 class SubjectService:
     """Service for managing subjects"""
     
     def __init__(self):
         """Initialize subject service"""
-        self.subjects_file = Path("subjects.json")
-        self._load_subjects()
+        self.legacy_subjects_file = Path("subjects.json")
+        
+        # Uploads are processed in worker threads, so share one connection
+        # per process and serialize access to it
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
     
-    def _load_subjects(self):
-        """Load subjects from file"""
-        if self.subjects_file.exists():
-            with open(self.subjects_file, 'r') as f:
-                self.subjects = json.load(f)
-        else:
-            self.subjects = {}
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        Get this process's database connection, opening it on first use
+        
+        The service is created in the gunicorn master when the app is
+        preloaded, and a SQLite connection must not be used across fork.
+        """
+        with self._lock:
+            if self._conn is None or self._conn_pid != os.getpid():
+                conn = sqlite3.connect(
+                    settings.SUBJECTS_DB_PATH,
+                    isolation_level=None,
+                    check_same_thread=False
+                )
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA foreign_keys=ON")
+                conn.executescript(SCHEMA)
+                
+                self._conn = conn
+                self._conn_pid = os.getpid()
+                self._import_legacy_subjects()
+            return self._conn
     
-    def _save_subjects(self):
-        """Save subjects to file"""
-        with open(self.subjects_file, 'w') as f:
-            json.dump(self.subjects, f, indent=2)
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements in a single write transaction"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+    
+    def _import_legacy_subjects(self):
+        """Import subjects from subjects.json into an empty database"""
+        if not self.legacy_subjects_file.exists():
+            return
+        
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM subjects LIMIT 1").fetchone():
+                return
+            
+            with open(self.legacy_subjects_file, 'r') as f:
+                subjects = json.load(f)
+            
+            for subject in subjects.values():
+                conn.execute(
+                    "INSERT INTO subjects (id, name, description, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        subject["id"],
+                        subject["name"],
+                        subject.get("description"),
+                        subject["created_at"]
+                    )
+                )
+                conn.executemany(
+                    "INSERT INTO documents "
+                    "(id, subject_id, filename, file_type, uploaded_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            document["id"],
+                            subject["id"],
+                            document["filename"],
+                            document["file_type"],
+                            document["uploaded_at"]
+                        )
+                        for document in subject.get("documents", [])
+                    ]
+                )
+    
+    def _get_documents(self, subject_id: str) -> List[Dict]:
+        """Get the document references of a subject, oldest first"""
+        rows = self.conn.execute(
+            "SELECT id, filename, file_type, uploaded_at, total_chars "
+            "FROM documents WHERE subject_id = ? ORDER BY rowid",
+            (subject_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
     
     def create_subject(self, name: str, description: Optional[str] = None) -> Dict:
         """
@@ -49,8 +152,12 @@ class SubjectService:
             "documents": []
         }
         
-        self.subjects[subject_id] = subject
-        self._save_subjects()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO subjects (id, name, description, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (subject_id, name, description, subject["created_at"])
+            )
         
         return subject
     
@@ -64,7 +171,19 @@ class SubjectService:
         Returns:
             Subject data or None
         """
-        return self.subjects.get(subject_id)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, name, description, created_at FROM subjects "
+                "WHERE id = ?",
+                (subject_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            subject = dict(row)
+            subject["documents"] = self._get_documents(subject_id)
+        
+        return subject
     
     def list_subjects(self) -> List[Dict]:
         """
@@ -73,7 +192,22 @@ class SubjectService:
         Returns:
             List of subjects
         """
-        return list(self.subjects.values())
+        with self._lock:
+            subjects = {
+                row["id"]: {**row, "documents": []}
+                for row in self.conn.execute(
+                    "SELECT id, name, description, created_at FROM subjects "
+                    "ORDER BY rowid"
+                )
+            }
+            for row in self.conn.execute(
+                "SELECT id, subject_id, filename, file_type, uploaded_at, "
+                "total_chars FROM documents ORDER BY rowid"
+            ):
+                document = dict(row)
+                subjects[document.pop("subject_id")]["documents"].append(document)
+        
+        return list(subjects.values())
     
     def delete_subject(self, subject_id: str) -> bool:
         """
@@ -85,15 +219,15 @@ class SubjectService:
         Returns:
             True if deleted, False if not found
         """
-        if subject_id not in self.subjects:
+        if self.get_subject(subject_id) is None:
             return False
         
         # Delete from vector DB
         vector_db_service.delete_collection(subject_id)
         
-        # Delete from subjects
-        del self.subjects[subject_id]
-        self._save_subjects()
+        # Delete from subjects, documents are removed by the cascade
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM subjects WHERE id = ?", (subject_id,))
         
         return True
     
@@ -102,7 +236,8 @@ class SubjectService:
         subject_id: str,
         document_id: str,
         filename: str,
-        file_type: str
+        file_type: str,
+        total_chars: Optional[int] = None
     ) -> bool:
         """
         Add a document reference to a subject
@@ -112,22 +247,28 @@ class SubjectService:
             document_id: Document identifier
             filename: Name of the file
             file_type: Type of the file
+            total_chars: Length of the extracted text
             
         Returns:
             True if successful
         """
-        if subject_id not in self.subjects:
-            return False
-        
-        document = {
-            "id": document_id,
-            "filename": filename,
-            "file_type": file_type,
-            "uploaded_at": datetime.now().isoformat()
-        }
-        
-        self.subjects[subject_id]["documents"].append(document)
-        self._save_subjects()
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO documents "
+                    "(id, subject_id, filename, file_type, uploaded_at, total_chars) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        document_id,
+                        subject_id,
+                        filename,
+                        file_type,
+                        datetime.now().isoformat(),
+                        total_chars
+                    )
+                )
+        except sqlite3.IntegrityError:
+            return False  # Subject does not exist
         
         return True
     
@@ -141,10 +282,12 @@ class SubjectService:
         Returns:
             Number of documents
         """
-        subject = self.subjects.get(subject_id)
-        if not subject:
-            return 0
-        return len(subject.get("documents", []))
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE subject_id = ?",
+                (subject_id,)
+            ).fetchone()
+        return row[0]
 
 
 # Singleton instance
@@ -1,31 +1,275 @@
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+import faiss
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
-import uuid
+import torch
+import numpy as np
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 from config import settings
+from utils.onnx_embeddings import OnnxSentenceEncoder
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, where the app runs as a single process
+
+
+class FaissCollection:
+    """Chunks of one subject in a flat inner-product FAISS index"""
+    
+    def __init__(self, index_dir: Path, subject_id: str, dimension: int):
+        """
+        Load a subject's index from disk, or start an empty one
+        
+        Args:
+            index_dir: Directory holding the index files
+            subject_id: Subject identifier
+            dimension: Size of the embeddings
+        """
+        self.index_path = index_dir / f"{subject_id}.faiss"
+        self.data_path = index_dir / f"{subject_id}.pkl"
+        self.lock_path = index_dir / ".lock"
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        
+        with self._lock:
+            self._reload()
+    
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Lock the index files against other worker processes"""
+        if fcntl is None:
+            yield
+            return
+        
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _disk_version(self) -> Optional[Tuple[int, int]]:
+        """Identify the data file on disk, which is replaced on every save"""
+        try:
+            stat = self.data_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
+    def _load(self):
+        """Load the index and chunk data from disk, or start empty"""
+        self._version = self._disk_version()
+        if self._version is not None and self.index_path.exists():
+            self.index = faiss.read_index(str(self.index_path))
+            with open(self.data_path, 'rb') as f:
+                data = pickle.load(f)
+            self.ids = data["ids"]
+            self.documents = data["documents"]
+            self.metadatas = data["metadatas"]
+        else:
+            # Embeddings are normalized, so inner product is cosine similarity
+            self.index = faiss.IndexFlatIP(self.dimension)
+            self.ids = []
+            self.documents = []
+            self.metadatas = []
+    
+    def _reload(self):
+        """Load the collection while no other process is writing it"""
+        with self._file_lock(exclusive=False):
+            self._load()
+    
+    def _refresh(self):
+        """Reload the collection if another process changed it on disk"""
+        if self._disk_version() != self._version:
+            self._reload()
+    
+    def count(self) -> int:
+        """Get the number of chunks in the collection"""
+        with self._lock:
+            self._refresh()
+            return self.index.ntotal
+    
+    def add(
+        self,
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict],
+        ids: List[str]
+    ):
+        """
+        Add chunks to the index and persist it
+        
+        Args:
+            embeddings: float32 array of normalized embeddings
+            documents: Chunk texts
+            metadatas: Metadata for each chunk
+            ids: Unique ID for each chunk
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            # Start from the latest saved state so chunks added by other
+            # workers are kept
+            if self._disk_version() != self._version:
+                self._load()
+            self.index.add(embeddings)
+            self.ids.extend(ids)
+            self.documents.extend(documents)
+            self.metadatas.extend(metadatas)
+            self._save()
+            self._version = self._disk_version()
+    
+    def query(
+        self,
+        query_embedding: np.ndarray,
+        n_results: int
+    ) -> Tuple[List[str], List[Dict], List[float]]:
+        """
+        Find the chunks most similar to a query embedding
+        
+        Args:
+            query_embedding: float32 array of shape (1, dimension)
+            n_results: Number of results to return
+            
+        Returns:
+            Documents, metadata and cosine distances, closest first
+        """
+        with self._lock:
+            self._refresh()
+            similarities, indices = self.index.search(query_embedding, n_results)
+            hits = [
+                (self.documents[i], self.metadatas[i], 1.0 - float(similarity))
+                for i, similarity in zip(indices[0], similarities[0])
+                if i >= 0
+            ]
+        
+        return (
+            [document for document, _, _ in hits],
+            [metadata for _, metadata, _ in hits],
+            [distance for _, _, distance in hits]
+        )
+    
+    def get(self) -> Tuple[List[str], List[Dict]]:
+        """
+        Get every chunk in the collection
+        
+        Returns:
+            Documents and metadata, in insertion order
+        """
+        with self._lock:
+            self._refresh()
+            return list(self.documents), list(self.metadatas)
+    
+    def delete(self):
+        """Delete the collection's files"""
+        with self._lock, self._file_lock(exclusive=True):
+            self.index_path.unlink(missing_ok=True)
+            self.data_path.unlink(missing_ok=True)
+    
+    def _save(self):
+        """Write the index and chunk data, replacing the files atomically"""
+        tmp_index_path = self.index_path.with_suffix(".faiss.tmp")
+        tmp_data_path = self.data_path.with_suffix(".pkl.tmp")
+        
+        faiss.write_index(self.index, str(tmp_index_path))
+        with open(tmp_data_path, 'wb') as f:
+            pickle.dump(
+                {
+                    "ids": self.ids,
+                    "documents": self.documents,
+                    "metadatas": self.metadatas
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        
+        os.replace(tmp_index_path, self.index_path)
+        os.replace(tmp_data_path, self.data_path)
 
 
 class VectorDBService:
-    """Service for managing ChromaDB operations and embeddings"""
+    """Service for managing FAISS indexes and embeddings"""
     
     def __init__(self):
-        """Initialize ChromaDB client and embedding model"""
-        # Initialize ChromaDB with persistent storage
-        self.client = chromadb.PersistentClient(
-            path=settings.CHROMA_PERSIST_DIRECTORY,
-            settings=ChromaSettings(
-                anonymized_telemetry=False,
-                allow_reset=True
+        """Initialize the index directory and embedding model"""
+        # Each subject's index is persisted as a pair of files
+        self.index_dir = Path(settings.FAISS_INDEX_DIRECTORY)
+        self.index_dir.mkdir(exist_ok=True)
+        self._collections: Dict[str, FaissCollection] = {}
+        self._collections_lock = threading.Lock()
+        
+        # Initialize embedding model, either an exported ONNX model or
+        # sentence-transformers in FP16 on GPU if available
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        if settings.EMBEDDING_ONNX_DIR:
+            print(f"Loading ONNX embedding model: {settings.EMBEDDING_ONNX_DIR}")
+            self.embedding_model = OnnxSentenceEncoder(
+                settings.EMBEDDING_ONNX_DIR,
+                device=self.device
             )
+        else:
+            print(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
+            self.embedding_model = SentenceTransformer(
+                settings.EMBEDDING_MODEL,
+                device=self.device
+            )
+            if self.device == "cuda":
+                self.embedding_model.half()
+        print(f"Embedding model loaded on device: {self.device}")
+        self.dimension = self.embedding_model.get_sentence_embedding_dimension()
+        
+        # Cache query embeddings so repeated questions skip the model
+        self._encode_query = lru_cache(maxsize=settings.QUERY_CACHE_SIZE)(
+            self._encode_query_uncached
+        )
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts into normalized embeddings
+        
+        Args:
+            texts: List of texts to encode
+            
+        Returns:
+            float32 array with one embedding per row
+        """
+        embeddings = self.embedding_model.encode(
+            texts,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
         )
+        return embeddings.astype(np.float32, copy=False)
+    
+    def encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        Encode document chunks for add_documents
+        
+        Args:
+            chunks: List of text chunks
+            
+        Returns:
+            float32 array with one embedding per row
+        """
+        return self._encode(chunks)
+    
+    def _encode_query_uncached(self, query: str) -> bytes:
+        """
+        Encode a single query into its raw embedding bytes
         
-        # Initialize embedding model
-        print(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-        print(f"Embedding model loaded successfully")
+        Args:
+            query: Query text
+            
+        Returns:
+            float32 embedding as bytes, immutable so it is safe to cache
+        """
+        return self._encode([query]).tobytes()
         
-    def get_or_create_collection(self, subject_id: str):
+    def get_or_create_collection(self, subject_id: str) -> FaissCollection:
         """
         Get or create a collection for a subject
         
@@ -33,17 +277,63 @@ class VectorDBService:
             subject_id: Unique identifier for the subject
             
         Returns:
-            ChromaDB collection
+            FAISS collection
         """
-        collection_name = f"subject_{subject_id}"
-        return self.client.get_or_create_collection(name=collection_name)
+        with self._collections_lock:
+            collection = self._collections.get(subject_id)
+            if collection is None:
+                collection = FaissCollection(self.index_dir, subject_id, self.dimension)
+                if collection.count() == 0:
+                    self._import_chroma_collection(subject_id, collection)
+                self._collections[subject_id] = collection
+        return collection
+    
+    def _import_chroma_collection(self, subject_id: str, collection: FaissCollection):
+        """
+        Copy a subject's chunks from a ChromaDB store created by older versions
+        
+        Args:
+            subject_id: Subject identifier
+            collection: Empty FAISS collection to fill
+        """
+        if not Path(settings.CHROMA_PERSIST_DIRECTORY).exists():
+            return
+        
+        try:
+            import chromadb
+            from chromadb.config import Settings as ChromaSettings
+        except ImportError:
+            return  # chromadb is only needed for this migration
+        
+        try:
+            client = chromadb.PersistentClient(
+                path=settings.CHROMA_PERSIST_DIRECTORY,
+                settings=ChromaSettings(anonymized_telemetry=False)
+            )
+            results = client.get_collection(name=f"subject_{subject_id}").get(
+                include=["embeddings", "documents", "metadatas"]
+            )
+        except Exception:
+            return  # Collection might not exist
+        
+        if results["ids"]:
+            embeddings = np.asarray(results["embeddings"], dtype=np.float32)
+            faiss.normalize_L2(embeddings)
+            collection.add(
+                embeddings=embeddings,
+                documents=results["documents"],
+                metadatas=results["metadatas"],
+                ids=results["ids"]
+            )
+            print(f"Imported {len(results['ids'])} chunks of subject {subject_id} from ChromaDB")
     
     def add_documents(
         self,
         subject_id: str,
         document_id: str,
         chunks: List[str],
-        metadata: Dict
+        metadata: Dict,
+        embeddings: Optional[np.ndarray] = None
     ) -> int:
         """
         Add document chunks to the vector database
@@ -53,6 +343,7 @@ class VectorDBService:
             document_id: Document identifier
             chunks: List of text chunks
             metadata: Metadata about the document
+            embeddings: Precomputed chunk embeddings, encoded here if omitted
             
         Returns:
             Number of chunks added
@@ -63,18 +354,15 @@ class VectorDBService:
         collection = self.get_or_create_collection(subject_id)
         
         # Generate embeddings using sentence-transformers
-        embeddings = self.embedding_model.encode(chunks).tolist()
+        if embeddings is None:
+            embeddings = self.encode_chunks(chunks)
         
         # Create unique IDs for each chunk
         chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
         
         # Create metadata for each chunk
         metadatas = [
-            {
-                **metadata,
-                "chunk_index": i,
-                "document_id": document_id
-            }
+            dict(metadata, chunk_index=i, document_id=document_id)
             for i in range(len(chunks))
         ]
         
@@ -109,7 +397,8 @@ class VectorDBService:
             collection = self.get_or_create_collection(subject_id)
             
             # Check if collection has any documents
-            if collection.count() == 0:
+            count = collection.count()
+            if count == 0:
                 return {
                     "documents": [],
                     "metadatas": [],
@@ -117,18 +406,21 @@ class VectorDBService:
                 }
             
             # Generate query embedding using sentence-transformers
-            query_embedding = self.embedding_model.encode([query]).tolist()
+            query_embedding = np.frombuffer(
+                self._encode_query(query),
+                dtype=np.float32
+            ).reshape(1, -1).copy()
             
             # Query the collection
-            results = collection.query(
-                query_embeddings=query_embedding,
-                n_results=min(n_results, collection.count())
+            documents, metadatas, distances = collection.query(
+                query_embedding,
+                n_results=min(n_results, count)
             )
             
             return {
-                "documents": results["documents"][0] if results["documents"] else [],
-                "metadatas": results["metadatas"][0] if results["metadatas"] else [],
-                "distances": results["distances"][0] if results["distances"] else []
+                "documents": documents,
+                "metadatas": metadatas,
+                "distances": distances
             }
         except Exception as e:
             print(f"Error querying documents: {str(e)}")
@@ -138,6 +430,37 @@ class VectorDBService:
                 "distances": []
             }
     
+    def get_all_documents(self, subject_id: str) -> Dict:
+        """
+        Get every chunk in a subject's collection, in document order
+        
+        Args:
+            subject_id: Subject identifier
+            
+        Returns:
+            Documents and metadata, without distances
+        """
+        try:
+            collection = self.get_or_create_collection(subject_id)
+            documents, metadatas = collection.get()
+            
+            chunks = sorted(
+                zip(documents, metadatas),
+                key=lambda item: (item[1]["document_id"], item[1]["chunk_index"])
+            )
+            return {
+                "documents": [document for document, _ in chunks],
+                "metadatas": [metadata for _, metadata in chunks],
+                "distances": []
+            }
+        except Exception as e:
+            print(f"Error fetching documents: {str(e)}")
+            return {
+                "documents": [],
+                "metadatas": [],
+                "distances": []
+            }
+    
     def delete_collection(self, subject_id: str):
         """
         Delete a subject's collection
@@ -145,11 +468,11 @@ class VectorDBService:
         Args:
             subject_id: Subject identifier
         """
-        collection_name = f"subject_{subject_id}"
-        try:
-            self.client.delete_collection(name=collection_name)
-        except Exception:
-            pass  # Collection might not exist
+        with self._collections_lock:
+            collection = self._collections.pop(subject_id, None)
+        if collection is None:
+            collection = FaissCollection(self.index_dir, subject_id, self.dimension)
+        collection.delete()
     
     def get_collection_count(self, subject_id: str) -> int:
         """
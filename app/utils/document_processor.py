@@ -1,26 +1,42 @@
-import PyPDF2
-from typing import List
-import io
+import fitz  # PyMuPDF
+from typing import List, Union
 from pathlib import Path
+import threading
 
 
-def extract_text_from_pdf(file_content: bytes) -> str:
+# PyMuPDF does not support multithreaded use, and uploads are processed
+# in threadpool threads, so only one thread may use it at a time
+_fitz_lock = threading.Lock()
+
+
+def _open_pdf(source: Union[bytes, str, Path]) -> fitz.Document:
+    """
+    Open a PDF from in-memory content or from a file on disk
+    
+    Args:
+        source: PDF file content in bytes, or path to a PDF file
+        
+    Returns:
+        Opened PyMuPDF document
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source, filetype="pdf")
+
+
+def extract_text_from_pdf(source: Union[bytes, str, Path]) -> str:
     """
     Extract text from PDF file content
     
     Args:
-        file_content: PDF file content in bytes
+        source: PDF file content in bytes, or path to a PDF file
         
     Returns:
         Extracted text from the PDF
     """
     try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        with _fitz_lock, _open_pdf(source) as doc:
+            text = "\n".join(page.get_text("text") for page in doc)
         
         return text.strip()
     except Exception as e:
@@ -72,28 +88,31 @@ def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> Lis
     text_length = len(text)
     
     while start < text_length:
-        # Get the chunk
         end = start + chunk_size
-        chunk = text[start:end]
         
         # If this is not the last chunk and doesn't end at the text boundary,
-        # try to break at a sentence or word boundary
+        # try to break at a sentence or word boundary. Search the window in
+        # place rather than slicing it out first.
         if end < text_length:
             # Look for sentence ending
-            last_period = chunk.rfind('.')
-            last_newline = chunk.rfind('\n')
+            last_period = text.rfind('.', start, end)
+            last_newline = text.rfind('\n', start, end)
             last_break = max(last_period, last_newline)
             
-            if last_break > chunk_size * 0.5:  # Only break if we're past halfway
-                end = start + last_break + 1
-                chunk = text[start:end]
+            if last_break - start > chunk_size * 0.5:  # Only break if we're past halfway
+                end = last_break + 1
         
         # Add the chunk if it has content
-        if chunk.strip():
-            chunks.append(chunk.strip())
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
         
-        # Move start position (with overlap)
-        start = end - chunk_overlap if end < text_length else text_length
+        # Move start position (with overlap), always advancing by at least
+        # half the chunk so a large overlap can't crawl through the text
+        if end < text_length:
+            start = max(end - chunk_overlap, start + (end - start + 1) // 2)
+        else:
+            start = text_length
     
     return chunks
 
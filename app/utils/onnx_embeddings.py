@@ -0,0 +1,114 @@
+from typing import List
+from pathlib import Path
+import sys
+import numpy as np
+from transformers import AutoTokenizer
+
+
+# File written by ORTQuantizer next to the exported model
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+
+class OnnxSentenceEncoder:
+    """Sentence embedding model running on ONNX Runtime"""
+    
+    def __init__(self, model_dir: str, device: str = "cpu", max_length: int = 256):
+        """
+        Load an exported (and optionally quantized) ONNX model
+        
+        Args:
+            model_dir: Directory created by export_quantized_model
+            device: "cuda" or "cpu"
+            max_length: Maximum number of tokens per text
+        """
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        
+        quantized = (Path(model_dir) / QUANTIZED_MODEL_FILE).exists()
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=QUANTIZED_MODEL_FILE if quantized else "model.onnx",
+            provider="CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+        )
+        self.max_length = max_length
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        """Get the size of the produced embeddings"""
+        return self.model.config.hidden_size
+    
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False
+    ) -> np.ndarray:
+        """
+        Encode texts with mean pooling, like SentenceTransformer.encode
+        
+        Args:
+            texts: List of texts to encode
+            batch_size: Number of texts per forward pass
+            convert_to_numpy: Accepted for compatibility, always numpy
+            normalize_embeddings: Whether to L2-normalize the embeddings
+            show_progress_bar: Accepted for compatibility, ignored
+            
+        Returns:
+            Array with one embedding per row
+        """
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            
+            # Mean pooling over the non-padding tokens
+            mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+            summed = (hidden * mask).sum(axis=1)
+            batches.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+        
+        embeddings = np.concatenate(batches).astype(np.float32, copy=False)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        return embeddings
+
+
+def export_quantized_model(model_name: str, output_dir: str):
+    """
+    Export a sentence-transformers model to ONNX with dynamic int8 weights
+    
+    Args:
+        model_name: HuggingFace model to export
+        output_dir: Directory to write the ONNX model and tokenizer to
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    
+    # Dynamic quantization uses the VNNI int8 dot-product instructions
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantizer.quantize(
+        save_dir=output_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(
+            is_static=False,
+            per_channel=False
+        )
+    )
+
+
+if __name__ == "__main__":
+    from config import settings
+    
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else "./minilm_onnx"
+    export_quantized_model(settings.EMBEDDING_MODEL, output_dir)
+    print(f"Quantized ONNX model written to {output_dir}")